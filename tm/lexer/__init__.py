@@ -1,9 +1,15 @@
 from .lexer import Lexer
-from .utils import RewindableStream, TupleFilter
+from .utils import TokenStream
 
 
 def lex(source):
     """
-    Produces a rewindable stream of tokens from the given source.
+    Produces a rewindable stream of tokens from the given source. The whole
+    input is tokenized up front, so the parser's look-ahead operations are
+    plain index arithmetic on the materialized buffer.
     """
-    return RewindableStream(TupleFilter(Lexer(source), '_location'))
+    items = []
+    for (token, location) in Lexer(source):
+        token._location = location
+        items.append(token)
+    return TokenStream(items)
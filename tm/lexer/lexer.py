@@ -1,8 +1,9 @@
-from enum import Enum
+import sys
+from collections import deque
 from pathlib import Path
 
 from . import tokens
-from .tokenizer import Tokenizer
+from .tokenizer import CompiledTokens, Tokenizer
 from .line_stream import LineStream
 
 
@@ -18,7 +19,11 @@ class UndefinedMacroArgument(ValueError):
     pass
 
 
-class Mode(Enum):
+class Mode:
+    """
+    Lexer mode constants. Plain integers rather than an Enum, since the mode
+    is compared and used as a lookup key on every token.
+    """
     DEFAULT = 1
     MULTILINE_STRING = 2
     MACRO_DEFINITION = 3
@@ -66,9 +71,14 @@ MODE_TOKENS = {
     ]
 }
 
+# Compiled once so that mode switches do not rebuild regular expressions.
+MODE_TOKENS = {mode: CompiledTokens(toks) for mode, toks in MODE_TOKENS.items()}
+
 
 class MacroCall:
 
+    __slots__ = ('name', 'args', 'is_optional')
+
     def __init__(self, name, is_optional):
         self.name = name
         self.args = []
@@ -86,14 +96,29 @@ class MacroCall:
 
 class Context:
 
+    __slots__ = ('line_stream', 'macros', 'acc', 'c_call', 'n_call',
+                 'tokenizer')
+
     def __init__(self, source, macro_call=None):
         self.line_stream = LineStream(source)
         self.macros = dict()
-        self.acc = ''
+        self.acc = []
         self.c_call = macro_call
         self.n_call = None
         self.tokenizer = Tokenizer()
 
+    def reset(self, source, macro_call=None):
+        """
+        Re-initializes a pooled context for reuse, keeping the Tokenizer.
+        """
+        self.line_stream = LineStream(source)
+        self.macros.clear()
+        self.acc.clear()
+        self.c_call = macro_call
+        self.n_call = None
+        self.tokenizer.set_string('')
+        return self
+
     @property
     def is_file(self):
         return bool(self.line_stream.path)
@@ -101,54 +126,109 @@ class Context:
 
 class Lexer:
 
+    __slots__ = ('stack', 'x', 'file_stack', 'macros', '_path_cache', 'mode',
+                 '_handlers', 'in_multiline_string', '_location', '_column',
+                 '_expansion_cache', '_recordings', '_pending', '_ctx_pool')
+
     def __init__(self, source):
         self.stack = []
+        self.x = None  # the current Context, always self.stack[-1]
+        self.file_stack = []  # the file Contexts on the stack, innermost last
+        self.macros = {}  # flat macro table: name -> stack of values
+        self._path_cache = {}  # (parent, string) -> resolved Path
+        self._expansion_cache = {}  # see _on_macro_call_end
+        self._recordings = []  # expansions being recorded: (Context, key, pairs)
+        self._pending = deque()  # replayed (token, location) pairs
+        self._ctx_pool = []  # popped Contexts available for reuse
+        self.mode = None
         self.push(source)
         self.set_mode(Mode.PREPROCESSOR)
         self.in_multiline_string = False
 
-    @property
-    def x(self):
-        """
-        Returns the current Context.
-        """
-        return self.stack[-1] if self.stack else None
-
     def push(self, source, macro_call=None):
         """
-        Adds a new Context to the stack. Resets the accumulator and tokenizer
-        of the current one.
+        Adds a new Context to the stack and makes it the current one. Resets
+        the accumulator and tokenizer of the previous one.
         """
         if self.x:
-            self.x.acc = ''
+            self.x.acc.clear()
             self.x.tokenizer.set_string('')
-        self.stack.append(Context(source, macro_call))
+        if self._ctx_pool:
+            self.x = self._ctx_pool.pop().reset(source, macro_call)
+        else:
+            self.x = Context(source, macro_call)
+        self.stack.append(self.x)
+        if self.x.is_file:
+            self.file_stack.append(self.x)
+        if self.mode is not None:
+            self.x.tokenizer.set_possible_tokens(MODE_TOKENS[self.mode])
 
     def pop(self):
         """
-        Removes the current Context from the stack and returns it.
+        Removes the current Context from the stack and returns it. The one
+        below it, if any, becomes current.
         """
-        return self.stack.pop()
+        x = self.stack.pop()
+        self.x = self.stack[-1] if self.stack else None
+        if self.x is not None:
+            self.x.tokenizer.set_possible_tokens(MODE_TOKENS[self.mode])
+        if x.is_file:
+            self.file_stack.pop()
+        for name in x.macros:
+            values = self.macros[name]
+            values.pop()
+            if not values:
+                del self.macros[name]
+        if x.macros:
+            # The macro table changed; cached expansions are no longer valid.
+            self._invalidate_expansions()
+        elif self._recordings and self._recordings[-1][0] is x:
+            (_, key, pairs) = self._recordings.pop()
+            self._expansion_cache[key] = pairs
+        self._ctx_pool.append(x)
+        return x
+
+    def _invalidate_expansions(self):
+        self._expansion_cache.clear()
+        self._recordings.clear()
 
     def set_mode(self, mode):
+        if mode is self.mode:
+            # push() and pop() configure the tokenizer of the context they
+            # make current, so nothing is left to do.
+            return
         self.mode = mode
+        self._handlers = _MODE_HANDLERS[mode]
         self.x.tokenizer.set_possible_tokens(MODE_TOKENS[mode])
 
     def add_macro(self, name, value):
         """
-        Adds a new macro to the appropriate Context. Only the first or a file
-        context can hold macros.
+        Adds a new macro to the appropriate Context: the innermost file
+        context, or the current one when no file is on the stack. The flat
+        macro table is updated alongside, so that resolution does not have to
+        scan the stack.
         """
-        for x in reversed(self.stack):
-            if x.is_file:
-                x.macros[name] = value
-                return
-        self.x.macros[name] = value
+        x = self.file_stack[-1] if self.file_stack else self.x
+
+        # Identical bodies (macros redefined per include, say) then share one
+        # string, which also keeps expansion cache keys cheap to compare.
+        value = sys.intern(value)
+
+        if name in x.macros:
+            # The owning context already defines the macro; its value is
+            # necessarily the innermost one.
+            self.macros[name][-1] = value
+        else:
+            self.macros.setdefault(name, []).append(value)
+        x.macros[name] = value
+
+        # The macro table changed; cached expansions are no longer valid.
+        self._invalidate_expansions()
 
     def resolve_macro(self, mc):
-        for x in reversed(self.stack):
-            if mc.name in x.macros:
-                return x.macros[mc.name]
+        values = self.macros.get(mc.name)
+        if values:
+            return values[-1]
 
         if not mc.is_optional:
             raise UndefinedMacro(mc.name)
@@ -156,114 +236,221 @@ class Lexer:
         return ''
 
     def resolve_path(self, string):
-        parent = None
-        for x in reversed(self.stack):
-            if x.is_file:
-                parent = x.line_stream.path.parent
-                break
-
-        if parent:
-            return parent / Path(string)
-        return Path(string)
+        """
+        Resolves an include target relative to the innermost file context.
+        Results are cached, since the same file is often included repeatedly.
+        """
+        parent = self.file_stack[-1].line_stream.path.parent if self.file_stack else None
+        key = (parent, string)
+        path = self._path_cache.get(key)
+        if path is None:
+            path = parent / Path(string) if parent else Path(string)
+            self._path_cache[key] = path
+        return path
+
+    def _next_token(self):
+        """
+        Reads the next raw token from the current context, refilling the
+        tokenizer and popping exhausted contexts as needed. Returns None at
+        the end of input.
+
+        The line's base location is left in self._location and the token's
+        column in self._column; a Location is only built for tokens that are
+        actually emitted (see _emit_location), since most preprocessor-level
+        tokens never leave the lexer.
+        """
+        while True:
+            x = self.x
+            tokenizer = x.tokenizer
+            if not tokenizer:
+                line_info = next(x.line_stream)
+
+                if line_info is None:
+                    if self.mode in (Mode.MACRO_EXPANSION, Mode.MACRO_DEFINITION):
+                        raise UnexpectedEndOfInput()
+
+                    if len(self.stack) > 1:
+                        self.pop()
+                        if self.mode != Mode.MACRO_DEFINITION:
+                            self.set_mode(Mode.PREPROCESSOR)
+                        continue
 
-    def __next__(self):
-        if not self.x.tokenizer:
-            line_info = next(self.x.line_stream)
+                    if self.in_multiline_string:
+                        raise UnexpectedEndOfInput()
 
-            if line_info is None:
-                if self.mode in [Mode.MACRO_EXPANSION, Mode.MACRO_DEFINITION]:
-                    raise UnexpectedEndOfInput()
+                    return None
 
-                if len(self.stack) > 1:
-                    self.stack.pop()
-                    if self.mode == Mode.MACRO_DEFINITION:
-                        # Ensure tokenizer has the correct set of possible tokens
-                        self.set_mode(Mode.MACRO_DEFINITION)
-                    else:
-                        self.set_mode(Mode.PREPROCESSOR)
-                    return next(self)
+                (line, self._location) = line_info
+                tokenizer.set_string(line)
 
-                if self.in_multiline_string:
-                    raise UnexpectedEndOfInput()
+            (token, self._column) = next(tokenizer)
+            return token
 
+    def __next__(self):
+        while True:
+            # Replayed expansion tokens must drain before any new input is
+            # read: a handler ahead can fill self._pending mid-iteration
+            # (see _on_macro_call_end).
+            if self._pending:
+                pair = self._pending.popleft()
+                if self._recordings:
+                    self._record(pair)
+                return pair
+
+            token = self._next_token()
+            if token is None:
                 return None
 
-            (line, self._location) = line_info
-            self.x.tokenizer.set_string(line)
-
-        (token, column) = next(self.x.tokenizer)
-        self._location = self._location.move_to(column)
+            token = self._handlers[token.KIND](self, token)
+            if token is None:
+                continue
 
-        if self.mode == Mode.PREPROCESSOR:
+            pair = (token, self._emit_location())
+            if self._recordings:
+                self._record(pair)
+            return pair
 
-            if not self.in_multiline_string and isinstance(token, tokens.MacroDefinitionStart):
-                self.handle_macro_definition(token)
+    def _emit_location(self):
+        return self._location.move_to(self._column)
 
-            elif not self.in_multiline_string and isinstance(token, tokens.Include):
-                self.push(self.resolve_path(token.value))
-                self.set_mode(Mode.PREPROCESSOR)
+    def _record(self, pair):
+        for (_, _, pairs) in self._recordings:
+            pairs.append(pair)
 
-            elif not self.in_multiline_string and isinstance(token, tokens.SharpComment):
-                pass
+    def __iter__(self):
+        """
+        Iterates over the (token, location) pairs, terminating at the end of
+        input instead of returning None forever.
+        """
+        while True:
+            pair = next(self)
+            if pair is None:
+                return
+            yield pair
 
-            elif isinstance(token, tokens.MacroArgument):
-                if len(self.x.c_call.args) <= token.value:
-                    raise UndefinedMacroArgument(token.value)
-                self.x.acc += self.x.c_call.args[token.value]
-                self.x.acc += self.x.tokenizer.remaining_string()
+    # Token actions. Each takes the token just read and returns either the
+    # token to emit or None when it was consumed internally. set_mode() points
+    # self._handlers at the current mode's KIND-indexed table of actions, so
+    # handling a token is a two-level index plus one call.
 
-                self.push(self.x.acc, self.x.c_call)
-                self.set_mode(Mode.PREPROCESSOR)
+    def _emit(self, token):
+        return token
 
-            elif isinstance(token, tokens.MacroCallStart):
-                self.x.n_call = MacroCall(*token.value)
-                self.set_mode(Mode.MACRO_EXPANSION)
+    def _ignore(self, token):
+        return None
 
-            else:
-                self.x.acc += token.matched_string
+    # Mode.PREPROCESSOR handlers
 
-                if not self.x.tokenizer:
-                    self.push(self.x.acc, self.x.n_call)
-                    if self.in_multiline_string:
-                        self.set_mode(Mode.MULTILINE_STRING)
-                    else:
-                        self.set_mode(Mode.DEFAULT)
+    def _on_macro_definition_start(self, token):
+        if self.in_multiline_string:
+            self._accumulate(token)
+            return
+        self.handle_macro_definition(token)
 
-            return next(self)
-
-        elif self.mode == Mode.MACRO_EXPANSION:
+    def _on_include(self, token):
+        if self.in_multiline_string:
+            self._accumulate(token)
+            return
+        self.push(self.resolve_path(token.value))
+        self.set_mode(Mode.PREPROCESSOR)
 
-            if isinstance(token, tokens.MultilineStringStart):
-                token = self.handle_multiline_string(self.mode)
+    def _on_sharp_comment(self, token):
+        if self.in_multiline_string:
+            self._accumulate(token)
 
-            if isinstance(token, (tokens.DoubleQuotedString, tokens.MultilineString)):
-                self.x.n_call.args.append(token.value)
+    def _on_macro_argument(self, token):
+        x = self.x
+        if len(x.c_call.args) <= token.value:
+            raise UndefinedMacroArgument(token.value)
+        x.acc.append(x.c_call.args[token.value])
+        x.acc.append(x.tokenizer.take_remaining())
 
-            elif isinstance(token, tokens.MacroCallEnd):
-                self.x.acc += self.resolve_macro(self.x.n_call)
-                self.x.acc += self.x.tokenizer.remaining_string()
+        self.push(''.join(x.acc), x.c_call)
+        self.set_mode(Mode.PREPROCESSOR)
 
-                self.push(self.x.acc, self.x.n_call)
-                self.set_mode(Mode.PREPROCESSOR)
+    def _on_macro_call_start(self, token):
+        self.x.n_call = MacroCall(*token.value)
+        self.set_mode(Mode.MACRO_EXPANSION)
 
-            return next(self)
+    def _accumulate(self, token):
+        x = self.x
+        x.acc.append(token.matched_string)
 
-        elif self.mode == Mode.DEFAULT:
+        if not x.tokenizer:
+            self.push(''.join(x.acc), x.n_call)
+            if self.in_multiline_string:
+                self.set_mode(Mode.MULTILINE_STRING)
+            else:
+                self.set_mode(Mode.DEFAULT)
+
+    # Mode.MACRO_EXPANSION handlers
+
+    def _on_arg_multiline_string_start(self, token):
+        self._on_arg_string(self.handle_multiline_string(Mode.MACRO_EXPANSION))
+
+    def _on_arg_string(self, token):
+        self.x.n_call.args.append(token.value)
+
+    def _on_macro_call_end(self, token):
+        x = self.x
+        x.acc.append(self.resolve_macro(x.n_call))
+        x.acc.append(x.tokenizer.take_remaining())
+
+        # Expanding the same text with the same arguments in the same macro
+        # environment always produces the same tokens, so the processed token
+        # stream of each expansion context is recorded and replayed on
+        # identical later expansions. The key also carries the multiline
+        # string flag, which changes how lines are handled, and the include
+        # resolution base, since a relative include in the body reads a
+        # different file per including directory. The cache is dropped
+        # whenever the macro table changes.
+        source = ''.join(x.acc)
+        base = self.file_stack[-1].line_stream.path.parent if self.file_stack else None
+        key = (source, tuple(x.n_call.args), self.in_multiline_string, base)
+
+        cached = self._expansion_cache.get(key)
+        if cached is not None:
+            x.acc.clear()
+            self._pending.extend(cached)
+            self.set_mode(Mode.PREPROCESSOR)
+            return
+
+        self.push(source, x.n_call)
+        self.set_mode(Mode.PREPROCESSOR)
+        self._recordings.append((self.x, key, []))
 
-            if isinstance(token, tokens.MultilineStringStart):
-                token = self.handle_multiline_string(self.mode)
+    # Mode.DEFAULT handlers
 
-        return (token, self._location)
+    def _on_multiline_string_start(self, token):
+        return self.handle_multiline_string(Mode.DEFAULT)
 
     def handle_multiline_string(self, previous_mode):
         self.set_mode(Mode.MULTILINE_STRING)
         self.in_multiline_string = True
 
         lines = []
-        (token, _) = next(self)
-        while not isinstance(token, tokens.MultilineStringEnd):
+        while True:
+            # The preprocessor may still have to run on refilled lines, so
+            # tokens go through the mode actions; only the emit path is
+            # skipped. Note that reading a token can itself switch modes, so
+            # self._handlers must be read afterwards. Replayed expansion
+            # tokens are consumed here as well, and re-recorded for enclosing
+            # expansions.
+            if self._pending:
+                pair = self._pending.popleft()
+                if self._recordings:
+                    self._record(pair)
+                token = pair[0]
+            else:
+                token = self._next_token()
+                token = self._handlers[token.KIND](self, token)
+                if token is None:
+                    continue
+                if self._recordings:
+                    self._record((token, self._emit_location()))
+            if type(token) is tokens.MultilineStringEnd:
+                break
             lines.append(token.matched_string)
-            (token, _) = next(self)
 
         self.set_mode(previous_mode)
         self.in_multiline_string = False
@@ -273,20 +460,55 @@ class Lexer:
         self.set_mode(Mode.MACRO_DEFINITION)
 
         macro_name = token.value
-        macro_value = ''
+        macro_value = []
         nesting = 0
 
-        (token, _) = next(self)
-        while not (isinstance(token, tokens.MacroDefinitionEnd) and nesting == 0):
-            if isinstance(token, tokens.MacroDefinitionStart):
+        # In Mode.MACRO_DEFINITION every action is a plain emit and the mode
+        # survives context pops, so tokens can be read raw.
+        token = self._next_token()
+        while not (type(token) is tokens.MacroDefinitionEnd and nesting == 0):
+            if type(token) is tokens.MacroDefinitionStart:
                 nesting += 1
-                macro_value += token.matched_string
-            elif isinstance(token, tokens.MacroDefinitionEnd):
+                macro_value.append(token.matched_string)
+            elif type(token) is tokens.MacroDefinitionEnd:
                 nesting -= 1
-                macro_value += token.matched_string
+                macro_value.append(token.matched_string)
             elif token.value:
-                macro_value += token.matched_string
-            (token, _) = next(self)
+                macro_value.append(token.matched_string)
+            token = self._next_token()
 
-        self.add_macro(macro_name, macro_value)
+        self.add_macro(macro_name, ''.join(macro_value))
         self.set_mode(Mode.PREPROCESSOR)
+
+
+def _handler_table(handlers, default=None):
+    """
+    Builds a dispatch table indexed by token KIND (see tokens.Token.KIND) from
+    a dict mapping token class to handler. Slots of unlisted token classes get
+    @default.
+    """
+    table = [default] * tokens.NUM_KINDS
+    for token_class, handler in handlers.items():
+        table[token_class.KIND] = handler
+    return tuple(table)
+
+
+_MODE_HANDLERS = {
+    Mode.DEFAULT: _handler_table({
+        tokens.MultilineStringStart: Lexer._on_multiline_string_start,
+    }, default=Lexer._emit),
+    Mode.MULTILINE_STRING: _handler_table({}, default=Lexer._emit),
+    Mode.MACRO_DEFINITION: _handler_table({}, default=Lexer._emit),
+    Mode.PREPROCESSOR: _handler_table({
+        tokens.MacroDefinitionStart: Lexer._on_macro_definition_start,
+        tokens.Include: Lexer._on_include,
+        tokens.SharpComment: Lexer._on_sharp_comment,
+        tokens.MacroArgument: Lexer._on_macro_argument,
+        tokens.MacroCallStart: Lexer._on_macro_call_start,
+    }, default=Lexer._accumulate),
+    Mode.MACRO_EXPANSION: _handler_table({
+        tokens.MultilineStringStart: Lexer._on_arg_multiline_string_start,
+        tokens.DoubleQuotedString: Lexer._on_arg_string,
+        tokens.MacroCallEnd: Lexer._on_macro_call_end,
+    }, default=Lexer._ignore),
+}
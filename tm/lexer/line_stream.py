@@ -1,13 +1,17 @@
 from pathlib import Path
-from io import StringIO
 
 
 class Location:
     """
     Holds the information about the position of a character (in practice, the
     first character of a token) in a file or string.
+
+    One instance is created per token, so the attributes live in slots to
+    keep the allocation small and dict-free.
     """
 
+    __slots__ = ('path', 'line_num', 'column')
+
     def __init__(self, path, line_num, column=0):
         self.path = path
         self.line_num = line_num
@@ -49,24 +53,21 @@ class LineStream:
     """
 
     def __init__(self, source):
-        self.file = None
         if isinstance(source, str):
             self.path = None
-            self.file = StringIO(source)
         elif isinstance(source, Path):
             self.path = source
-            self.file = open(source, 'r')
+            # Sources comfortably fit in memory; reading the whole file at
+            # once and splitting it is cheaper than per-line reads.
+            source = source.read_text()
         else:
             raise ValueError(source)
+        self.lines = iter(source.splitlines(keepends=True))
         self.line_num = 0
 
     def __next__(self):
-        line = self.file.readline()
-        if not line:
+        line = next(self.lines, None)
+        if line is None:
             return None
         self.line_num += 1
         return (line, Location(self.path, self.line_num))
-
-    def __del__(self):
-        if self.file is not None:
-            self.file.close()
@@ -1,7 +1,7 @@
+from itertools import zip_longest
 from pathlib import Path
 from unittest import TestCase
 
-from .utils import UntilNoneIterator
 
 from .lexer import (
     Lexer,
@@ -130,7 +130,7 @@ Datetime(datetime.datetime(2020, 8, 10, 0, 0))
 EndOfLine('\\n')
 Name('bar')
 WhiteSpace(' ')
-Timedelta(datetime.timedelta(14, 240))
+Timedelta(datetime.timedelta(days=14, seconds=240))
 EndOfLine('\\n')
 """
 
@@ -148,6 +148,41 @@ WhiteSpace(' ')
 EndOfLine('\\n')
 """
 
+CASE_MACRO_REPEATED = """\
+macro m [hello world]
+${m}
+${m}
+${m}
+---
+Name('hello')
+WhiteSpace(' ')
+Name('world')
+EndOfLine('\\n')
+Name('hello')
+WhiteSpace(' ')
+Name('world')
+EndOfLine('\\n')
+Name('hello')
+WhiteSpace(' ')
+Name('world')
+EndOfLine('\\n')
+"""
+
+CASE_MACRO_REPEATED_TRAILING = """\
+macro m [hello]
+${m} bar
+${m} bar
+---
+Name('hello')
+WhiteSpace(' ')
+Name('bar')
+EndOfLine('\\n')
+Name('hello')
+WhiteSpace(' ')
+Name('bar')
+EndOfLine('\\n')
+"""
+
 CASE_MACRO_OPTION = """\
 a ${?foo} b
 ---
@@ -388,6 +423,18 @@ EndOfLine('\\n')
 """
 
 
+PCASE_MACRO_INCLUDE_BASE = """\
+test_assets/minc
+---
+Name('rootx')
+EndOfLine('\\n')
+EndOfLine('\\n')
+Name('subx')
+EndOfLine('\\n')
+EndOfLine('\\n')
+"""
+
+
 def with_cases(cls):
     g = globals()
     for c in g:
@@ -407,15 +454,18 @@ class Test(TestCase):
 
     @staticmethod
     def _tokenize(source):
-        return '\n'.join(str(x[0]) for x in UntilNoneIterator(Lexer(source)))
+        return '\n'.join(str(x[0]) for x in Lexer(source))
 
     def run_case(self, case, p):
         source, expected_tokens = case.split('---\n')
         if p:
-            tokens = self._tokenize(_module_dir / Path(source.strip()))
-        else:
-            tokens = self._tokenize(source)
-        self.assertEqual(expected_tokens, tokens + '\n')
+            source = _module_dir / Path(source.strip())
+        # Tokens are compared one by one, so a failure points at the first
+        # diverging token instead of diffing one big joined string.
+        expected = expected_tokens.splitlines()
+        actual = (str(x[0]) for x in Lexer(source))
+        for i, (e, a) in enumerate(zip_longest(expected, actual)):
+            self.assertEqual(e, a, 'at token %d' % i)
 
     def assert_raises(self, exception, source):
         with self.assertRaises(exception):
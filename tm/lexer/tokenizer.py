@@ -1,6 +1,40 @@
 import re
 
 
+class CompiledTokens:
+    """
+    Holds the compiled form of a list of possible tokens: the combined
+    regular expression and the mapping from group name back to token class.
+
+    Compiling once and sharing the result avoids rebuilding the regular
+    expression every time a Tokenizer switches token sets.
+    """
+
+    def __init__(self, possible_tokens):
+        self.by_name = {t.__name__: t for t in possible_tokens}
+        self.pattern = _combine(possible_tokens)
+
+
+def _combine(possible_tokens):
+    """
+    Compiles the patterns of the given tokens into a single alternation.
+    """
+    return re.compile('|'.join(
+        '(?P<%s>%s)' % (t.__name__, t.pattern)
+        for t in possible_tokens
+    ))
+
+
+# Compiled forms of token lists passed to set_possible_tokens() directly,
+# keyed by the tuple of token classes. The key is a tuple, not a frozenset,
+# because alternation order encodes match preference.
+_compiled_cache = {}
+
+
+# Shared by all tokenizers that have not been given a token set yet.
+_NO_TOKENS = CompiledTokens([])
+
+
 class Tokenizer:
     """
     Provider an interface for tokenizing a string, producing a stream of tokens.
@@ -20,39 +54,69 @@ class Tokenizer:
     """
 
     def __init__(self):
+        self._pattern = None
         self.set_string('')
-        self.set_possible_tokens([])
+        self.set_possible_tokens(_NO_TOKENS)
 
     def __bool__(self):
-        return len(self.string) > self.position
+        return self.length > self.position
 
     def __next__(self):
-        m = self._pattern.match(self.string, self.position)
-        if not m:
+        # Attribute accesses are hoisted into locals; this runs once per
+        # token, so the LOAD_FAST/LOAD_ATTR difference adds up.
+        position = self.position
+        if self.length <= position:
             return None
 
-        token_name = m.lastgroup
-        value = m.group()
-        position = self.position
-        self.position += len(value)
+        # Matches are pulled from a single finditer() call covering the rest
+        # of the string, so the regex engine loops over the line in C instead
+        # of being entered once per token. The iterator is rebuilt whenever
+        # the string or the token set changes mid-line.
+        matches = self._matches
+        if matches is None:
+            matches = self._matches = self._pattern.finditer(self.string, position)
+
+        m = next(matches, None)
+        if m is None or m.start() != position:
+            self._matches = None
+            return None
 
-        token_class = self.possible_tokens[token_name]
-        return (token_class(value), position)
+        self.position = m.end()
+
+        token_class = self.possible_tokens[m.lastgroup]
+        return (token_class(m.group()), position)
 
     def set_string(self, string):
         self.string = string
+        self.length = len(string)
         self.position = 0
+        self._matches = None
 
     def set_possible_tokens(self, possible_tokens):
-        self.possible_tokens = {t.__name__: t for t in possible_tokens}
-        patterns = [
-            '(?P<%s>%s)' % (t.__name__, t.pattern)
-            for t in possible_tokens
-        ]
-        self._pattern = re.compile('|'.join(patterns))
-
-    def remaining_string(self):
-        return self.string[self.position:]
+        """
+        @possible_tokens Either a CompiledTokens instance, which is reused as
+                         is, or a list of token classes, compiled on first
+                         use and memoized.
+        """
+        if not isinstance(possible_tokens, CompiledTokens):
+            key = tuple(possible_tokens)
+            possible_tokens = _compiled_cache.get(key)
+            if possible_tokens is None:
+                possible_tokens = _compiled_cache[key] = CompiledTokens(key)
+        if self._pattern is not possible_tokens.pattern:
+            self._matches = None
+        self.possible_tokens = possible_tokens.by_name
+        self._pattern = possible_tokens.pattern
+
+    def take_remaining(self):
+        """
+        Returns the rest of the string and advances past it, leaving the
+        tokenizer exhausted.
+        """
+        remaining = self.string[self.position:]
+        self.position = self.length
+        self._matches = None
+        return remaining
 
     def __repr__(self):
         """
@@ -1,8 +1,10 @@
-import json
 import re
+import sys
 from abc import ABC
 from datetime import datetime, timedelta
-from textwrap import dedent
+from itertools import count
+
+_kind_counter = count()
 
 
 class Token(ABC):
@@ -16,9 +18,25 @@ class Token(ABC):
 
              Concrete tokens must set this to a regular expression pattern
              string.
+
+    @KIND Class attribute. A small integer identifying the token type,
+          assigned automatically and contiguously. Allows dispatching on the
+          token type through a list indexed by KIND, which is cheaper than a
+          chain of isinstance() checks.
     """
+    __slots__ = ('matched_string', 'value', '_location')
     pattern = None
 
+    KIND = next(_kind_counter)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.KIND = next(_kind_counter)
+        # Tokens that re-run their own pattern in process() get a compiled
+        # form for free, instead of going through the re module cache.
+        if cls.pattern is not None:
+            cls.compiled = re.compile(cls.pattern)
+
     def __init__(self, matched_string):
         self.matched_string = matched_string
         self.value = self.process(matched_string)
@@ -49,49 +67,49 @@ def _anything_up_to(pattern):
 
     >>> import re; pattern = _anything_up_to('foo')
     >>> re.match(pattern, "\\n")
-    <_sre.SRE_Match object; span=(0, 1), match='\\n'>
+    <re.Match object; span=(0, 1), match='\\n'>
 
     >>> re.match(pattern, "ab\\n")
-    <_sre.SRE_Match object; span=(0, 3), match='ab\\n'>
+    <re.Match object; span=(0, 3), match='ab\\n'>
 
     >>> re.match(pattern, "abfoo")
-    <_sre.SRE_Match object; span=(0, 2), match='ab'>
+    <re.Match object; span=(0, 2), match='ab'>
 
     >>> re.match(pattern, "abfoo\\n")
-    <_sre.SRE_Match object; span=(0, 2), match='ab'>
+    <re.Match object; span=(0, 2), match='ab'>
 
     >>> re.match(pattern, "abfoo foo")
-    <_sre.SRE_Match object; span=(0, 2), match='ab'>
+    <re.Match object; span=(0, 2), match='ab'>
 
     >>> re.match(pattern, "abfoo foo\\n")
-    <_sre.SRE_Match object; span=(0, 2), match='ab'>
+    <re.Match object; span=(0, 2), match='ab'>
 
     Note that the pattern will also match if @pattern is at the begining of the
     string.
 
     >>> re.match(pattern, "foo")
-    <_sre.SRE_Match object; span=(0, 3), match='foo'>
+    <re.Match object; span=(0, 3), match='foo'>
 
     >>> re.match(pattern, "foo\\n")
-    <_sre.SRE_Match object; span=(0, 4), match='foo\\n'>
+    <re.Match object; span=(0, 4), match='foo\\n'>
 
     >>> re.match(pattern, "foo foo")
-    <_sre.SRE_Match object; span=(0, 4), match='foo '>
+    <re.Match object; span=(0, 4), match='foo '>
 
     >>> re.match(pattern, "foo foo\\n")
-    <_sre.SRE_Match object; span=(0, 4), match='foo '>
+    <re.Match object; span=(0, 4), match='foo '>
 
     >>> re.match(pattern, "foobar")
-    <_sre.SRE_Match object; span=(0, 6), match='foobar'>
+    <re.Match object; span=(0, 6), match='foobar'>
 
     >>> re.match(pattern, "foobar\\n")
-    <_sre.SRE_Match object; span=(0, 7), match='foobar\\n'>
+    <re.Match object; span=(0, 7), match='foobar\\n'>
 
     >>> re.match(pattern, "foo foobar")
-    <_sre.SRE_Match object; span=(0, 4), match='foo '>
+    <re.Match object; span=(0, 4), match='foo '>
 
     >>> re.match(pattern, "foo foobar\\n")
-    <_sre.SRE_Match object; span=(0, 4), match='foo '>
+    <re.Match object; span=(0, 4), match='foo '>
     """
     return r'\n|.+?(?=(' + pattern + r'|$))\n?'
 
@@ -100,6 +118,7 @@ class Comment(Token, ABC):
     """
     Helper class for "comment" tokens.
     """
+    __slots__ = ()
 
     @property
     def kind(self):
@@ -114,6 +133,7 @@ class String(Token, ABC):
     """
     Helper class for "string" tokens.
     """
+    __slots__ = ()
 
     @property
     def kind(self):
@@ -129,20 +149,21 @@ class SharpComment(Comment):
 
     >>> import re; This = SharpComment
     >>> re.match(This.pattern, '# foo\\n')
-    <_sre.SRE_Match object; span=(0, 5), match='# foo'>
+    <re.Match object; span=(0, 5), match='# foo'>
 
     >>> re.match(This.pattern, '#')
-    <_sre.SRE_Match object; span=(0, 1), match='#'>
+    <re.Match object; span=(0, 1), match='#'>
 
     >>> re.match(This.pattern, '#\\n')
-    <_sre.SRE_Match object; span=(0, 1), match='#'>
+    <re.Match object; span=(0, 1), match='#'>
 
     >>> re.match(This.pattern, '#foo')
-    <_sre.SRE_Match object; span=(0, 4), match='#foo'>
+    <re.Match object; span=(0, 4), match='#foo'>
 
     >>> This('# comment text')
     Comment(None)
     """
+    __slots__ = ()
     delimiter = r'#'
     pattern = delimiter + r'.*'
 
@@ -156,10 +177,10 @@ class DoubleQuotedString(String):
 
     >>> import re; This = DoubleQuotedString
     >>> re.match(This.pattern, r'"foo \\"bar\\" buu" "wololo"')
-    <_sre.SRE_Match object; span=(0, 17), match='"foo \\\\"bar\\\\" buu"'>
+    <re.Match object; span=(0, 17), match='"foo \\\\"bar\\\\" buu"'>
 
     >>> re.match(This.pattern, r'""')
-    <_sre.SRE_Match object; span=(0, 2), match='""'>
+    <re.Match object; span=(0, 2), match='""'>
 
     >>> This('""')
     String('')
@@ -170,14 +191,27 @@ class DoubleQuotedString(String):
     >>> This(r'"foo\\"bar\\"foo"')
     String('foo"bar"foo')
     """
-    pattern = r'"(\\"|[^"])*"'
+    __slots__ = ()
+    # The two branches are mutually exclusive on their first character, so
+    # an unterminated string fails in linear time instead of backtracking
+    # through every way of splitting the body.
+    pattern = r'"(?:[^"\\]|\\.)*"'
+
+    _escape = re.compile(r'\\(.)')
+    _escape_map = {'n': '\n', 't': '\t', 'r': '\r'}
 
     @staticmethod
     def process(value):
         """
-        Handle escaped characters, especially the double quote.
+        Handle escaped characters, especially the double quote. Only the few
+        escapes a string can actually contain are translated; running a full
+        JSON parser per string was overkill.
         """
-        return json.loads(value)
+        if '\\' not in value:
+            return value[1:-1]
+        return DoubleQuotedString._escape.sub(
+            lambda m: DoubleQuotedString._escape_map.get(m.group(1), m.group(1)),
+            value[1:-1])
 
 
 class MultilineString(String):
@@ -197,10 +231,43 @@ class MultilineString(String):
     >>> MultilineString("\\n foo bar\\n   buu\\n")
     String('foo bar\\n  buu\\n')
     """
+    __slots__ = ()
 
     @staticmethod
     def process(text):
-        return dedent(text.lstrip('\n'))
+        # Equivalent to textwrap.dedent(), but computes the common margin and
+        # strips it in two plain passes instead of a regex substitution over
+        # the whole string.
+        lines = text.lstrip('\n').splitlines(keepends=True)
+
+        margin = None
+        for line in lines:
+            stripped = line.lstrip()
+            if not stripped:
+                continue
+            indent = line[:len(line) - len(stripped)]
+            if margin is None:
+                margin = indent
+            elif not indent.startswith(margin):
+                for i, (a, b) in enumerate(zip(margin, indent)):
+                    if a != b:
+                        margin = margin[:i]
+                        break
+                else:
+                    margin = margin[:len(indent)]
+
+        n = len(margin) if margin else 0
+        out = []
+        for line in lines:
+            if not line.strip():
+                # Whitespace-only lines are normalized to a bare newline,
+                # like textwrap.dedent() does.
+                out.append('\n' if line.endswith('\n') else '')
+            elif n and line.startswith(margin):
+                out.append(line[n:])
+            else:
+                out.append(line)
+        return ''.join(out)
 
 
 class MultilineStringStart(Token):
@@ -210,11 +277,12 @@ class MultilineStringStart(Token):
 
     >>> import re; This = MultilineStringStart
     >>> re.match(This.pattern, "-8<-")
-    <_sre.SRE_Match object; span=(0, 4), match='-8<-'>
+    <re.Match object; span=(0, 4), match='-8<-'>
 
     >>> re.match(This.pattern, "-8<-foo")
-    <_sre.SRE_Match object; span=(0, 4), match='-8<-'>
+    <re.Match object; span=(0, 4), match='-8<-'>
     """
+    __slots__ = ()
     pattern = r'-8<-'
 
     @staticmethod
@@ -229,15 +297,16 @@ class MultilineStringEnd(Token):
 
     >>> import re; This = MultilineStringEnd
     >>> re.match(This.pattern, "->8-")
-    <_sre.SRE_Match object; span=(0, 4), match='->8-'>
+    <re.Match object; span=(0, 4), match='->8-'>
 
     >>> re.match(This.pattern, "->8-foo")
-    <_sre.SRE_Match object; span=(0, 4), match='->8-'>
+    <re.Match object; span=(0, 4), match='->8-'>
 
     >>> re.match(MultilineStringStart.pattern, " ->8-")
 
     >>> re.match(MultilineStringStart.pattern, "f->8-")
     """
+    __slots__ = ()
     pattern = r'->8-'
 
     @staticmethod
@@ -249,6 +318,7 @@ class MultilineStringContent(Token):
     """
     Matches anything up to a MultilineStringEnd.
     """
+    __slots__ = ()
     pattern = _anything_up_to(MultilineStringEnd.pattern)
 
 
@@ -258,11 +328,12 @@ class WholeLine(Token):
 
     >>> import re; This = WholeLine
     >>> re.match(This.pattern, "foo bar \\n")
-    <_sre.SRE_Match object; span=(0, 9), match='foo bar \\n'>
+    <re.Match object; span=(0, 9), match='foo bar \\n'>
 
     >>> re.match(This.pattern, "\\n")
-    <_sre.SRE_Match object; span=(0, 1), match='\\n'>
+    <re.Match object; span=(0, 1), match='\\n'>
     """
+    __slots__ = ()
     pattern = r'(.|\n)+$'
 
 
@@ -273,8 +344,15 @@ class Name(Token):
         foo_bar
         _FOO_123
     """
+    __slots__ = ()
     pattern = r'[a-zA-Z_]\w*'
 
+    @staticmethod
+    def process(string):
+        # Names repeat constantly in typical input; interning lets equality
+        # checks against them hit the pointer-comparison fast path.
+        return sys.intern(string)
+
 
 class PositiveInteger(Token):
     """
@@ -283,6 +361,7 @@ class PositiveInteger(Token):
     >>> PositiveInteger('123')
     PositiveInteger(123)
     """
+    __slots__ = ()
     pattern = r'[1-9]\d*'
 
     @staticmethod
@@ -306,11 +385,12 @@ class Datetime(Token):
     >>> Datetime('2018-03-24')
     Datetime(datetime.datetime(2018, 3, 24, 0, 0))
     """
+    __slots__ = ()
     pattern = r'(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})(-(?P<hour>\d{2}):(?P<minute>\d{2}))?'
 
     @classmethod
     def process(cls, value):
-        m = re.match(cls.pattern, value)
+        m = cls.compiled.match(value)
         return datetime(**_cast_values(m.groupdict()))
 
 
@@ -319,27 +399,28 @@ class Timedelta(Token):
     Matches a time duration value.
 
     >>> Timedelta('1w2d13h25min')
-    Timedelta(datetime.timedelta(9, 48300))
+    Timedelta(datetime.timedelta(days=9, seconds=48300))
     >>> Timedelta('1w25min')
-    Timedelta(datetime.timedelta(7, 1500))
+    Timedelta(datetime.timedelta(days=7, seconds=1500))
     >>> Timedelta('2d13h25min')
-    Timedelta(datetime.timedelta(2, 48300))
+    Timedelta(datetime.timedelta(days=2, seconds=48300))
     >>> Timedelta('2d13h')
-    Timedelta(datetime.timedelta(2, 46800))
+    Timedelta(datetime.timedelta(days=2, seconds=46800))
     >>> Timedelta('2d')
-    Timedelta(datetime.timedelta(2))
+    Timedelta(datetime.timedelta(days=2))
     >>> Timedelta('13h25min')
-    Timedelta(datetime.timedelta(0, 48300))
+    Timedelta(datetime.timedelta(seconds=48300))
     >>> Timedelta('25min')
-    Timedelta(datetime.timedelta(0, 1500))
+    Timedelta(datetime.timedelta(seconds=1500))
     >>> Timedelta('13h')
-    Timedelta(datetime.timedelta(0, 46800))
+    Timedelta(datetime.timedelta(seconds=46800))
     """
+    __slots__ = ()
     pattern = r'(?=\d+(w|d|h|min))((?P<weeks>\d+)w)?((?P<days>\d+)d)?((?P<hours>\d+)h)?((?P<minutes>\d+)min)?'
 
     @classmethod
     def process(cls, value):
-        m = re.match(cls.pattern, value)
+        m = cls.compiled.match(value)
         return timedelta(**_cast_values(m.groupdict()))
 
 
@@ -347,6 +428,7 @@ class EndOfLine(Token):
     """
     Matches the end of a line.
     """
+    __slots__ = ()
     pattern = r'\n'
 
 
@@ -356,14 +438,15 @@ class WhiteSpace(Token):
 
     >>> import re; This = WhiteSpace
     >>> re.match(This.pattern, "   ")
-    <_sre.SRE_Match object; span=(0, 3), match='   '>
+    <re.Match object; span=(0, 3), match='   '>
 
     >>> re.match(This.pattern, "   \\n")
-    <_sre.SRE_Match object; span=(0, 3), match='   '>
+    <re.Match object; span=(0, 3), match='   '>
 
     >>> re.match(This.pattern, "   a")
-    <_sre.SRE_Match object; span=(0, 3), match='   '>
+    <re.Match object; span=(0, 3), match='   '>
     """
+    __slots__ = ()
     pattern = r'\s+?(?=($|[^\s]|[\n]))'
 
 
@@ -371,6 +454,7 @@ class Character(Token):
     """
     Matches any single character.
     """
+    __slots__ = ()
     pattern = r'.'
 
 
@@ -383,28 +467,32 @@ class MacroDefinitionStart(Token):
     >>> import re; This = MacroDefinitionStart
     >>> p = re.compile(This.pattern)
     >>> p.match(" macro foo [", 0)
-    <_sre.SRE_Match object; span=(0, 12), match=' macro foo ['>
+    <re.Match object; span=(0, 12), match=' macro foo ['>
 
     >>> p.match(" macro foo [", 1)
 
     >>> This("macro foo [")
     MacroDefinitionStart('foo')
     """
+    __slots__ = ()
     pattern = r'^\s*macro\s+([a-zA-Z_]\w*)\s+\['
 
     @classmethod
     def process(cls, value):
-        return re.match(cls.pattern, value).group(1)
+        # Macro names are used as dict keys; interning them makes the
+        # repeated lookups cheaper.
+        return sys.intern(cls.compiled.match(value).group(1))
 
 
 class MacroDefinitionEnd(Token):
     """
     >>> import re; This = MacroDefinitionEnd
     >>> re.match(This.pattern, "] \\n")
-    <_sre.SRE_Match object; span=(0, 3), match='] \\n'>
+    <re.Match object; span=(0, 3), match='] \\n'>
 
     >>> re.match(This.pattern, "] a\\n")
     """
+    __slots__ = ()
     pattern = r']\s+$'
 
     @classmethod
@@ -419,14 +507,15 @@ class MacroContent(Token):
 
     >>> import re; This = MacroContent
     >>> re.match(This.pattern, "foo bar ]")
-    <_sre.SRE_Match object; span=(0, 8), match='foo bar '>
+    <re.Match object; span=(0, 8), match='foo bar '>
 
     >>> re.match(This.pattern, "foo bar #c")
-    <_sre.SRE_Match object; span=(0, 8), match='foo bar '>
+    <re.Match object; span=(0, 8), match='foo bar '>
 
     >>> re.match(This.pattern, "foo bar \\n")
-    <_sre.SRE_Match object; span=(0, 9), match='foo bar \\n'>
+    <re.Match object; span=(0, 9), match='foo bar \\n'>
     """
+    __slots__ = ()
     pattern = r'[^\]#]+'
 
 
@@ -436,11 +525,12 @@ class MacroArgument(Token):
 
     >>> import re; This = MacroArgument
     >>> re.match(This.pattern, "${1}")
-    <_sre.SRE_Match object; span=(0, 4), match='${1}'>
+    <re.Match object; span=(0, 4), match='${1}'>
 
     >>> This("${1}")
     MacroArgument(0)
     """
+    __slots__ = ()
     pattern = r'\$\{[1-9]\d*}'
 
     @staticmethod
@@ -454,19 +544,19 @@ class MacroCallStart(Token):
 
     >>> import re; This = MacroCallStart
     >>> re.match(This.pattern, "${foo ")
-    <_sre.SRE_Match object; span=(0, 5), match='${foo'>
+    <re.Match object; span=(0, 5), match='${foo'>
 
     >>> re.match(This.pattern, "${foo}")
-    <_sre.SRE_Match object; span=(0, 5), match='${foo'>
+    <re.Match object; span=(0, 5), match='${foo'>
 
     >>> re.match(This.pattern, "${?foo ")
-    <_sre.SRE_Match object; span=(0, 6), match='${?foo'>
+    <re.Match object; span=(0, 6), match='${?foo'>
 
     >>> re.match(This.pattern, "${?foo}")
-    <_sre.SRE_Match object; span=(0, 6), match='${?foo'>
+    <re.Match object; span=(0, 6), match='${?foo'>
 
     >>> re.match(This.pattern, "${?foo")
-    <_sre.SRE_Match object; span=(0, 6), match='${?foo'>
+    <re.Match object; span=(0, 6), match='${?foo'>
 
     >>> re.match(This.pattern, "${foo.")
 
@@ -478,6 +568,7 @@ class MacroCallStart(Token):
     >>> This("${?foo ")
     MacroCallStart(('foo', True))
     """
+    __slots__ = ()
     pattern = r'\${(\??[a-zA-Z_]\w*)(?=(\s|}|$))'
 
     @staticmethod
@@ -489,14 +580,15 @@ class MacroCallStart(Token):
         """
         name = value[2:].strip()
         if name[0] == '?':
-            return (name[1:], True)
-        return (name, False)
+            return (sys.intern(name[1:]), True)
+        return (sys.intern(name), False)
 
 
 class NonMacroCall(Token):
     """
     Matches anything up to a MacroArgument or MacroCallStart.
     """
+    __slots__ = ()
     pattern = _anything_up_to(r'|'.join([
         MacroCallStart.pattern,
         MacroArgument.pattern,
@@ -508,6 +600,7 @@ class MacroCallEnd(Token):
     """
     Matches the end of a macro call.
     """
+    __slots__ = ()
     pattern = r'}'
 
     @staticmethod
@@ -523,13 +616,20 @@ class Include(Token):
 
     >>> import re; This = Include; string = '  include  "./foo"  \\n'
     >>> re.match(This.pattern, string)
-    <_sre.SRE_Match object; span=(0, 21), match='  include  "./foo"  \\n'>
+    <re.Match object; span=(0, 21), match='  include  "./foo"  \\n'>
 
     >>> This(string)
     Include('./foo')
     """
+    __slots__ = ()
     pattern = r'^\s*include\s+' + DoubleQuotedString.pattern + r'\s*$'
 
     @staticmethod
     def process(value):
-        return DoubleQuotedString.process(value.strip()[7:])
+        # Include targets are used as path cache keys; see Lexer.resolve_path.
+        return sys.intern(DoubleQuotedString.process(value.strip()[7:].lstrip()))
+
+
+# Total number of token kinds. Dispatch tables indexed by KIND must have this
+# many slots.
+NUM_KINDS = next(_kind_counter)
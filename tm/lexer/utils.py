@@ -1,149 +1,60 @@
-class UntilNoneIterator:
+class TokenStream:
     """
-    Generic iteretor for objects whose `__next__` returns None instead of raising
-    `StopIteration`.
+    A fully materialized stream with an integer cursor; every operation is a
+    list index or integer add. Past the last item it keeps returning None,
+    which marks the expected end of input for the parser.
 
-    >>> class Foo:
-    ...     x = 4
-    ...     def __next__(self):
-    ...         if self.x == 0:
-    ...             return None
-    ...         self.x -= 1
-    ...         return self.x
-    ...     def __iter__(self):
-    ...         return UntilNoneIterator(self)
-    ...
-    >>> print([i for i in Foo()])
-    [3, 2, 1, 0]
-
-    >>> [x for x in UntilNoneIterator(iter([1, 2, None]))]
-    [1, 2]
-    """
-
-    def __init__(self, obj):
-        self.obj = obj
-
-    def __next__(self):
-        value = next(self.obj)
-        if value is None:
-            raise StopIteration
-        return value
-
-    def __iter__(self):
-        return self
-
-
-class RewindableStream:
-    """
-    Wraps a stream object, providing a way to give back an item to the stream.
-    Useful for adding look-ahead functionality to an iterator.
-
-    >>> s = RewindableStream(iter(range(6)))
+    >>> s = TokenStream([0, 1, 2])
     >>> next(s)
     0
     >>> next(s)
     1
     >>> s.rewind(1)
+    >>> s.peek()
+    1
     >>> next(s)
     1
     >>> next(s)
     2
-    >>> s.peek()
-    3
-    >>> s.peek()
-    3
     >>> next(s)
-    3
     >>> next(s)
-    4
-    >>> s.rewind(2)
+    >>> s.rewind(3)
     >>> next(s)
-    3
+    2
     >>> next(s)
-    4
     """
 
-    def __init__(self, stream):
-        self.given = []
-        self.peeked = []
-        self.stream = stream
+    __slots__ = ('items', 'types', 'values', 'length', 'position', 'memo')
 
-    def __next__(self):
-        if self.peeked:
-            o = self.peeked.pop()
-        else:
-            o = next(self.stream)
+    def __init__(self, items):
+        self.items = items
+        # Parallel arrays of the item types and values, so hot loops can scan
+        # a homogeneous list instead of dereferencing each item.
+        self.types = [type(i) for i in items]
+        self.values = [getattr(i, 'value', None) for i in items]
+        self.length = len(items)
+        self.position = 0
+        self.memo = {}
 
-        self.given.append(o)
-        return o
+    def __next__(self):
+        position = self.position
+        self.position = position + 1
+        if position < self.length:
+            return self.items[position]
+        return None
 
     def peek(self):
-        if self.peeked:
-            return self.peeked[-1]
-
-        o = next(self.stream)
-        self.peeked.append(o)
-        return o
+        position = self.position
+        if position < self.length:
+            return self.items[position]
+        return None
 
     def rewind(self, n):
-        assert len(self.given) >= n
+        assert self.position >= n
 
-        for _ in range(n):
-            self.peeked.append(self.given.pop())
+        self.position -= n
 
     def flush(self):
-        self.given = []
-
-
-class TupleFilter:
-    """
-    Modifies a stream of tuples turning it into a stream of objects.  The first
-    element of the tuple is considered the main object. The remaining elements
-    become attributes of this object.
-
-    In the test below, Bar is some object; Foo is a stream of tuples whose
-    first element is of the Bar class.
-
-    >>> class Bar:
-    ...     def __init__(self, v):
-    ...         self.v = v
-    ...
-    >>> class Foo:
-    ...     s = [(Bar(1), 'b'), (Bar(2), 'd'), (Bar(3), 'f'), None]
-    ...     i = 0
-    ...     def __next__(self):
-    ...         t = self.s[self.i]
-    ...         self.i += 1
-    ...         return t
-    ...
-    >>> s = TupleFilter(Foo(), 'alt')
-    >>> i = next(s); print(i.v, i.alt)
-    1 b
-    >>> i = next(s); print(i.v, i.alt)
-    2 d
-    >>> i = next(s); print(i.v, i.alt)
-    3 f
-    >>> i = next(s); print(i)
-    None
-    """
-
-    def __init__(self, stream, *attr_names):
-        """
-        @stream The stream to be filtered
-        @attr_names The names to use for the attributes
-        """
-        self.stream = stream
-        self.attr_names = attr_names
-
-    def __next__(self):
-        tup = next(self.stream)
-        if tup is None:
-            return None
-
-        obj, *attr_values = tup
-        assert len(self.attr_names) == len(attr_values)
-
-        for name, value in zip(self.attr_names, attr_values):
-            setattr(obj, name, value)
-
-        return obj
+        # Nothing to drop; the buffer is the source. Memoized match results
+        # are keyed by position, which flushing used to reset, so clear them.
+        self.memo.clear()
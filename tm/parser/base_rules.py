@@ -1,9 +1,28 @@
+import sys
 from enum import Flag
 from abc import ABC, abstractmethod
 
 from ..lexer import tokens
 
 
+def _concrete_types(types):
+    """
+    Expands @types (a class or tuple of classes, possibly abstract) into the
+    frozenset of it and all its subclasses, so that membership of a token can
+    be tested with a type() lookup instead of an isinstance() call.
+    """
+    if not isinstance(types, tuple):
+        types = (types,)
+    out = set()
+    stack = list(types)
+    while stack:
+        t = stack.pop()
+        if t not in out:
+            out.add(t)
+            stack.extend(t.__subclasses__())
+    return frozenset(out)
+
+
 class Rule(ABC):
     """
     Abstract base rule class.
@@ -58,13 +77,18 @@ class BottomRule(Rule, ABC):
 
     types = None
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.types is not None:
+            self.types_set = _concrete_types(self.types)
+
     def match(self, x, token_s):
         if not self.condition(token_s.peek()):
             return False, None, 0
         return True, self.process(x, next(token_s)), 1
 
     def condition(self, token):
-        return isinstance(token, self.types)
+        return type(token) in self.types_set
 
     @staticmethod
     def process(x, token):
@@ -86,11 +110,10 @@ class V(BottomRule):
 
     def __init__(self, types, **kwargs):
         """
-        @types Must be suitable to serve as the second argument of the
-               isinstance() builtin.
+        @types A token class or tuple of token classes, possibly abstract.
         """
-        super().__init__(**kwargs)
         self.types = types
+        super().__init__(**kwargs)
 
 
 class N(BottomRule):
@@ -102,11 +125,23 @@ class N(BottomRule):
 
     def __init__(self, name, **kwargs):
         super().__init__(**kwargs)
-        self.name = name
+        # Interned to match Name token values, which are interned too.
+        self.name = sys.intern(name)
 
     def condition(self, token):
         return super().condition(token) and token.value == self.name
 
+    def match(self, x, token_s):
+        # Reads the materialized buffer directly; with both sides interned
+        # the value check is a pointer comparison.
+        position = token_s.position
+        if (position < token_s.length
+                and token_s.types[position] in self.types_set
+                and token_s.values[position] == self.name):
+            token_s.position = position + 1
+            return True, self.name, 1
+        return False, None, 0
+
 
 class C(BottomRule):
     """
@@ -116,15 +151,26 @@ class C(BottomRule):
     def __init__(self, chars, **kwargs):
         super().__init__(**kwargs)
         self.chars = chars
+        self.length = len(chars)
+        self.char_types = [tokens.Character] * self.length
 
     def match(self, x, token_s):
-        for i, char in enumerate(self.chars):
-            t = next(token_s)
-            if not (isinstance(t, tokens.Character) and t.value == char):
-                token_s.rewind(i + 1)
-                return False, None, 0
+        # The candidate tokens are sliced out of the materialized buffer in
+        # one go, so a failed match never moves the cursor and the character
+        # comparison is a single string equality.
+        position = token_s.position
+        end = position + self.length
+        if end > token_s.length:
+            return False, None, 0
 
-        return True, self.chars, len(self.chars)
+        if token_s.types[position:end] != self.char_types:
+            return False, None, 0
+
+        if ''.join(token_s.values[position:end]) != self.chars:
+            return False, None, 0
+
+        token_s.position = end
+        return True, self.chars, self.length
 
 
 class SkipBehavior(Flag):
@@ -163,6 +209,7 @@ class AndRule(Rule):
     skip_behavior = SkipBehavior.NORMAL
 
     rules = []
+    fixed_arity = 0
 
     def __init_subclass__(cls, **kwargs):
         """
@@ -171,60 +218,62 @@ class AndRule(Rule):
         """
         super().__init_subclass__(**kwargs)
         cls.rules = [make_rule(r, k=OrRule, s=cls) for r in cls.rules]
+        cls.whitespace_types = _concrete_types(cls.whitespace_tokens)
+        # When no sub-rule is optional or repeatable, exactly one value per
+        # sub-rule is produced and match() can fill preallocated slots.
+        cls.fixed_arity = (
+            None if any(r.is_optional or r.is_repeatable for r in cls.rules)
+            else len(cls.rules)
+        )
+        if cls.rules:
+            cls.match = _generate_match(cls)
 
     def match(self, x, token_s):
-        values = []
-        count = 0
-
-        for i, rule in enumerate(self.rules):
-            is_match, i_count = self.match_once(rule, x, token_s, values, is_first=(i == 0))
-            count += i_count
-
-            if not is_match and not rule.is_optional:
-                token_s.rewind(count)
-                return False, None, 0
-
-            while is_match and rule.is_repeatable:
-                is_match, i_count = self.match_once(rule, x, token_s, values)
-                count += i_count
-
-        return True, self.process(x, *values), count
+        # Subclasses with rules get a specialized implementation from
+        # _generate_match(); only a bare AndRule reaches this body, matching
+        # the empty sequence.
+        return True, self.process(x), 0
 
     @staticmethod
     def process(x, *args):
         return args or None
 
-    def match_once(self, rule, x, token_s, value_acc, is_first=False):
+    def match_once(self, rule_match, x, token_s, is_first=False):
         """
-        @value_acc Accumulator into which to put the matched value.
+        @rule_match The bound match method of the rule to try.
 
         @is_first Indicates whether we are at the very beginning of the rule
                   sequence. Used for the whitespace skipping behavior.
 
         Returns a tuple:
         - boolean indicating whether the rule matched
+        - the matched value, processed
         - the count of consumed tokens
-
-        Note that the matched value is added to an accumulator for convenience.
         """
-        s_count = 0
-
-        while isinstance(token_s.peek(), self.whitespace_tokens):
-            next(token_s)
-            s_count += 1
+        # The skip scan runs on the types array directly: one list index and
+        # one set probe per skipped token, no stream calls.
+        types = token_s.types
+        length = token_s.length
+        start = token_s.position
+        position = start
+        whitespace_types = self.whitespace_types
+        while position < length and types[position] in whitespace_types:
+            position += 1
+
+        s_count = position - start
+        token_s.position = position
 
         if not self.skip_behavior.validate(is_first, s_count):
-            token_s.rewind(s_count)
-            return False, 0
+            token_s.position = start
+            return False, None, 0
 
-        is_match, value, count = rule.match(x, token_s)
+        is_match, value, count = rule_match(x, token_s)
 
         if not is_match:
-            token_s.rewind(s_count)
-            return False, 0
+            token_s.position = start
+            return False, None, 0
 
-        value_acc.append(value)
-        return True, s_count + count
+        return True, value, s_count + count
 
 
 class OrRule(Rule):
@@ -233,17 +282,39 @@ class OrRule(Rule):
     """
 
     rules = []
+    compiled_rules = ()
+    match_by_type = {}
 
     def __init_subclass__(cls, **kwargs):
         """
-        Provides a rules defintion shortcut on @rules.
+        Provides a rules defintion shortcut on @rules. Also indexes the
+        alternatives by the token types they can start with, so match() only
+        tries the ones the next token could possibly begin.
         """
         super().__init_subclass__(**kwargs)
         cls.rules = [make_rule(r) for r in cls.rules]
+        cls.compiled_rules = tuple(r.match for r in cls.rules)
+
+        first_types = [_first_types(r) for r in cls.rules]
+        known = set()
+        for ft in first_types:
+            if ft is not None:
+                known |= ft
+        cls.match_by_type = {
+            t: tuple(r.match for (r, ft) in zip(cls.rules, first_types)
+                     if ft is None or t in ft)
+            for t in known
+        }
 
     def match(self, x, token_s):
-        for rule in self.rules:
-            is_match, value, count = rule.match(x, token_s)
+        # Token types absent from the table (whitespace a sub-rule may skip
+        # over, say) fall back to trying every alternative.
+        alternatives = self.match_by_type.get(type(token_s.peek()))
+        if alternatives is None:
+            alternatives = self.compiled_rules
+
+        for rule_match in alternatives:
+            is_match, value, count = rule_match(x, token_s)
             if is_match:
                 return True, self.process(x, value), count
         return False, None, 0
@@ -260,6 +331,130 @@ class Self:
     pass
 
 
+def memoized(rule_class):
+    """
+    Class decorator that caches match() results on the token stream, keyed by
+    the rule instance and the stream position, and replays them (advancing
+    the stream again on a hit) when an outer rule backtracks over the same
+    spot.
+
+    Opt-in: only worthwhile for expensive rules that outer alternatives
+    re-try often, and only correct for rules whose process() ignores the
+    context.
+    """
+    match = rule_class.match
+
+    def memoized_match(self, x, token_s):
+        key = (id(self), token_s.position)
+        hit = token_s.memo.get(key)
+        if hit is not None:
+            count = hit[2]
+            for _ in range(count):
+                next(token_s)
+            return hit
+
+        result = match(self, x, token_s)
+        token_s.memo[key] = result
+        return result
+
+    rule_class.match = memoized_match
+    return rule_class
+
+
+def _generate_match(cls):
+    """
+    Builds a match() specialized to @cls's rule sequence, unrolling the
+    sub-rule loop into straight-line code. Optional and repeatable branches
+    are only emitted for the sub-rules that declare them, and fixed-arity
+    sequences bypass the value accumulator entirely.
+
+    Sub-rules that are instances of @cls itself (see 'Self') are late-bound,
+    since the specialized method does not exist yet when they are created.
+    """
+    env = {}
+    fixed = cls.fixed_arity is not None
+    src = [
+        'def match(self, x, token_s):',
+        '    match_once = self.match_once',
+        '    start = token_s.position',
+    ]
+    if not fixed:
+        src.append('    values = []')
+
+    for (i, r) in enumerate(cls.rules):
+        if isinstance(r, cls):
+            env['r%d' % i] = r
+            m = 'r%d.match' % i
+        else:
+            env['m%d' % i] = r.match
+            m = 'm%d' % i
+
+        target = 'v%d' % i if fixed else 'value'
+        src.append('    (ok, %s, _) = match_once(%s, x, token_s, %s)'
+                   % (target, m, 'True' if i == 0 else 'False'))
+
+        if r.is_optional:
+            src.append('    if ok:')
+            src.append('        values.append(value)')
+        else:
+            src.append('    if not ok:')
+            src.append('        token_s.position = start')
+            src.append('        return (False, None, 0)')
+            if not fixed:
+                src.append('    values.append(value)')
+
+        if r.is_repeatable:
+            src.append('    while ok:')
+            src.append('        (ok, value, _) = match_once(%s, x, token_s)' % m)
+            src.append('        if ok:')
+            src.append('            values.append(value)')
+
+    if fixed:
+        args = ', '.join('v%d' % i for i in range(len(cls.rules)))
+        src.append('    return (True, self.process(x, %s), token_s.position - start)' % args)
+    else:
+        src.append('    return (True, self.process(x, *values), token_s.position - start)')
+
+    exec('\n'.join(src), env)
+    return env['match']
+
+
+def _first_types(rule):
+    """
+    Returns the frozenset of token types that a match of @rule can start
+    with, or None when that cannot be determined statically (in which case
+    the rule must always be tried).
+    """
+    if isinstance(rule, C):
+        return frozenset((tokens.Character,))
+
+    if isinstance(rule, BottomRule):
+        return rule.types_set
+
+    if isinstance(rule, OrRule):
+        out = set()
+        for r in rule.rules:
+            ft = _first_types(r)
+            if ft is None:
+                return None
+            out |= ft
+        return frozenset(out)
+
+    if isinstance(rule, AndRule) and rule.rules:
+        first = rule.rules[0]
+        if not first.is_optional:
+            ft = _first_types(first)
+            if ft is None:
+                return None
+            if rule.skip_behavior & (SkipBehavior.FIRST | SkipBehavior.OPTIONAL_FIRST):
+                # A match may begin by skipping whitespace, so whitespace
+                # types are possible first tokens as well.
+                ft = ft | rule.whitespace_types
+            return ft
+
+    return None
+
+
 def make_rule(r, k=AndRule, n='R', s=None):
     """
     Creates a new rule type from @r and returns an instance.
@@ -275,7 +470,7 @@ def make_rule(r, k=AndRule, n='R', s=None):
     elif isinstance(r, str):
         return N(r) if r.isidentifier() else C(r)
 
-    elif issubclass(r, tokens.Token):
+    elif isinstance(r, type) and issubclass(r, tokens.Token):
         return V(r)
 
     elif r is Self:
@@ -1,9 +1,9 @@
 from unittest import TestCase
 
 from ..lexer import lex
-from ..lexer.tokens import String, PositiveInteger
+from ..lexer.tokens import String, PositiveInteger, WhiteSpace
 
-from .base_rules import E, V, N, C, AndRule, OrRule, Self, SkipBehavior
+from .base_rules import E, V, N, C, AndRule, OrRule, Self, SkipBehavior, memoized
 
 r_eoi = E()
 r_bar = N('bar')
@@ -29,6 +29,11 @@ class Foo(AndRule):
     rules = ['foo']
 
 
+@memoized
+class FooBarMemo(AndRule):
+    rules = ['foo', 'bar']
+
+
 class Foo2(AndRule):
     rules = [Foo(repeatable=True)]
 
@@ -41,6 +46,19 @@ class FooOrBar(OrRule):
     rules = ['foo', 'bar']
 
 
+class JustWhiteSpace(AndRule):
+    rules = [V(WhiteSpace)]
+    skip_behavior = SkipBehavior.NO_SKIP
+
+
+class FooInt(AndRule):
+    rules = ['foo', V(PositiveInteger)]
+
+
+class WhiteSpaceOrFooInt(OrRule):
+    rules = [JustWhiteSpace(), FooInt()]
+
+
 class ThisBrace(AndRule):
     rules = ['this', '{']
 
@@ -62,10 +80,12 @@ class Composed(AndRule):
 
 
 foo_bar = FooBar()
+foo_bar_memo = FooBarMemo()
 foo_foo = FooFoo()
 foo_2 = Foo2()
 foo_0 = Foo0()
 foo_or_bar = FooOrBar()
+whitespace_or_foo_int = WhiteSpaceOrFooInt()
 this_brace = ThisBrace()
 this_brace_no_skip = ThisBraceNoSkip()
 this_brace_optional_skip = ThisBraceOptionalSkip()
@@ -151,6 +171,17 @@ class TestBottomRules(TestCase):
 
         self.assert_match(token_s, foo_0, (('foo',),))
 
+    def test_and_rule_memoized(self):
+        token_s = lex('foo bar')
+
+        self.assert_match(token_s, foo_bar_memo, ('foo', 'bar'))
+
+        token_s.rewind(3)
+
+        # Replayed from the memo; the stream is advanced just the same.
+        self.assert_match(token_s, foo_bar_memo, ('foo', 'bar'))
+        self.assert_match(token_s, r_eoi)
+
     def test_or_rule(self):
         token_s = lex('foo bar')
 
@@ -165,6 +196,17 @@ class TestBottomRules(TestCase):
 
         self.assert_no_match(token_s, foo_or_bar)
 
+    def test_or_rule_whitespace_first(self):
+        # One alternative starts with a whitespace token; the others must
+        # still be tried on whitespace input, since they may skip over it.
+        token_s = lex('  foo 1\n')
+
+        self.assert_match(token_s, whitespace_or_foo_int, ('foo', 1))
+
+        token_s = lex('foo 1\n')
+
+        self.assert_match(token_s, whitespace_or_foo_int, ('foo', 1))
+
     def test_composed_rule(self):
         token_s = lex('this { no }')
 